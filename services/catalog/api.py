@@ -1,18 +1,26 @@
 """FastAPI service for the cat catalog."""
 
 import os
+import warnings
+from collections import Counter
 from contextlib import asynccontextmanager
-from datetime import datetime, timezone
+from datetime import datetime, timedelta
 
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse, Response
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import desc
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import desc, func, insert, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from ..storage import get_bucket, get_s3_client
 from .models import Cat, ProcessedClip, Sighting, create_tables, get_session_factory
 
+CLIP_LOCK_TTL = int(os.environ.get("CLIP_LOCK_TTL", "3600"))
+
+# FastAPI 0.131+ deprecates ORJSONResponse in favour of Pydantic serialization
+# through response models; silence it until the endpoints declare them
+warnings.filterwarnings("ignore", message="ORJSONResponse is deprecated")
+
 Session = None
 
 
@@ -25,7 +33,11 @@ async def lifespan(app: FastAPI):
     yield
 
 
-app = FastAPI(title="Cat Catalog — Catalog Service", lifespan=lifespan)
+app = FastAPI(
+    title="Cat Catalog — Catalog Service",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 
 # --- Request/Response models ---
@@ -70,22 +82,21 @@ def create_cat(req: CatCreate):
         cat = Cat(name=req.name, notes=req.notes)
         session.add(cat)
         session.commit()
-        session.refresh(cat)
         return _cat_to_dict(cat)
 
 
 @app.get("/cats")
 def list_cats(limit: int = 50, offset: int = 0):
     with Session() as session:
-        cats = (
-            session.query(Cat)
-            .filter(Cat.deleted_at.is_(None))
+        rows = _fetch_dicts(
+            session,
+            select(*CAT_COLUMNS)
+            .where(Cat.deleted_at.is_(None))
             .order_by(desc(Cat.last_seen))
             .offset(offset)
-            .limit(limit)
-            .all()
+            .limit(limit),
         )
-        return [_cat_to_dict(c) for c in cats]
+        return ORJSONResponse(rows)
 
 
 @app.get("/cats/deleted")
@@ -97,9 +108,7 @@ def list_deleted_cats():
             .order_by(desc(Cat.deleted_at))
             .all()
         )
-        return [
-            {**_cat_to_dict(c), "deleted_at": c.deleted_at.isoformat()} for c in cats
-        ]
+        return [{**_cat_to_dict(c), "deleted_at": c.deleted_at} for c in cats]
 
 
 @app.get("/cats/{cat_id}")
@@ -122,7 +131,6 @@ def update_cat(cat_id: int, req: CatUpdate):
         if req.notes is not None:
             cat.notes = req.notes
         session.commit()
-        session.refresh(cat)
         return _cat_to_dict(cat)
 
 
@@ -132,26 +140,42 @@ def delete_cat(cat_id: int):
         cat = _get_active_cat(session, cat_id)
         if not cat:
             return JSONResponse(status_code=404, content={"error": "Cat not found"})
-        cat.deleted_at = datetime.now(timezone.utc)
+        cat.deleted_at = func.now()
         session.commit()
         return {"deleted": cat_id}
 
 
 @app.get("/cats/{cat_id}/sightings")
-def get_cat_sightings(cat_id: int, limit: int = 50, offset: int = 0):
+def get_cat_sightings(
+    cat_id: int,
+    limit: int = 50,
+    offset: int = 0,
+    before: datetime | None = None,
+    before_id: int | None = None,
+):
+    """List a cat's sightings, newest first.
+
+    Pass the timestamp and id of the last sighting on a page as before/before_id
+    to fetch the next page by keyset instead of OFFSET.
+    """
     with Session() as session:
         cat = _get_active_cat(session, cat_id)
         if not cat:
             return JSONResponse(status_code=404, content={"error": "Cat not found"})
-        sightings = (
-            session.query(Sighting)
-            .filter(Sighting.cat_id == cat_id, Sighting.deleted_at.is_(None))
-            .order_by(desc(Sighting.timestamp))
+        q = select(*SIGHTING_COLUMNS).where(
+            Sighting.cat_id == cat_id, Sighting.deleted_at.is_(None)
+        )
+        if before is not None and before_id is not None:
+            q = q.where(tuple_(Sighting.timestamp, Sighting.id) < (before, before_id))
+        elif before is not None:
+            q = q.where(Sighting.timestamp < before)
+        rows = _fetch_dicts(
+            session,
+            q.order_by(desc(Sighting.timestamp), desc(Sighting.id))
             .offset(offset)
-            .limit(limit)
-            .all()
+            .limit(limit),
         )
-        return [_sighting_to_dict(s) for s in sightings]
+        return ORJSONResponse(rows)
 
 
 # --- Sighting endpoints ---
@@ -160,27 +184,36 @@ def get_cat_sightings(cat_id: int, limit: int = 50, offset: int = 0):
 @app.post("/sightings")
 def create_sighting(req: SightingCreate):
     with Session() as session:
-        sighting = Sighting(
-            cat_id=req.cat_id,
-            confidence=req.confidence,
-            source_key=req.source_key,
-            crop_key=req.crop_key,
-            frame_timestamp=req.frame_timestamp,
-        )
-        session.add(sighting)
+        sighting = session.execute(
+            insert(Sighting).values(**_sighting_values(req)).returning(Sighting)
+        ).scalar_one()
 
         # Update cat stats if linked
         if req.cat_id:
-            cat = session.get(Cat, req.cat_id)
-            if cat:
-                cat.total_sightings += 1
-                cat.last_seen = datetime.now(timezone.utc)
+            _add_cat_sightings(session, req.cat_id, 1)
 
         session.commit()
-        session.refresh(sighting)
         return _sighting_to_dict(sighting)
 
 
+@app.post("/sightings/bulk")
+def create_sightings_bulk(reqs: list[SightingCreate]):
+    """Create many sightings with a single multi-row INSERT."""
+    if not reqs:
+        return []
+    with Session() as session:
+        sightings = session.scalars(
+            insert(Sighting).returning(Sighting, sort_by_parameter_order=True),
+            [_sighting_values(r) for r in reqs],
+        ).all()
+
+        for cat_id, count in Counter(r.cat_id for r in reqs if r.cat_id).items():
+            _add_cat_sightings(session, cat_id, count)
+
+        session.commit()
+        return [_sighting_to_dict(s) for s in sightings]
+
+
 @app.get("/sightings")
 def list_sightings(
     limit: int = 50,
@@ -188,13 +221,13 @@ def list_sightings(
     unassigned: bool = False,
 ):
     with Session() as session:
-        q = session.query(Sighting).filter(Sighting.deleted_at.is_(None))
+        q = select(*SIGHTING_COLUMNS).where(Sighting.deleted_at.is_(None))
         if unassigned:
-            q = q.filter(Sighting.cat_id.is_(None))
-        sightings = (
-            q.order_by(desc(Sighting.timestamp)).offset(offset).limit(limit).all()
-        )
-        return [_sighting_to_dict(s) for s in sightings]
+            q = q.where(Sighting.cat_id.is_(None))
+        # id breaks timestamp ties so offset pages never repeat or skip rows
+        q = q.order_by(desc(Sighting.timestamp), desc(Sighting.id))
+        rows = _fetch_dicts(session, q.offset(offset).limit(limit))
+        return ORJSONResponse(rows)
 
 
 @app.get("/sightings/deleted")
@@ -206,10 +239,7 @@ def list_deleted_sightings():
             .order_by(desc(Sighting.deleted_at))
             .all()
         )
-        return [
-            {**_sighting_to_dict(s), "deleted_at": s.deleted_at.isoformat()}
-            for s in sightings
-        ]
+        return [{**_sighting_to_dict(s), "deleted_at": s.deleted_at} for s in sightings]
 
 
 @app.get("/sightings/{sighting_id}")
@@ -240,19 +270,13 @@ def update_sighting(sighting_id: int, req: SightingUpdate):
 
         # Decrement old cat's count
         if old_cat_id and old_cat_id != new_cat_id:
-            old_cat = session.get(Cat, old_cat_id)
-            if old_cat:
-                old_cat.total_sightings = max(0, old_cat.total_sightings - 1)
+            _add_cat_sightings(session, old_cat_id, -1, touch_last_seen=False)
 
         # Increment new cat's count
         if new_cat_id and new_cat_id != old_cat_id:
-            new_cat = session.get(Cat, new_cat_id)
-            if new_cat:
-                new_cat.total_sightings += 1
-                new_cat.last_seen = datetime.now(timezone.utc)
+            _add_cat_sightings(session, new_cat_id, 1)
 
         session.commit()
-        session.refresh(sighting)
         return _sighting_to_dict(sighting)
 
 
@@ -265,10 +289,8 @@ def delete_sighting(sighting_id: int):
                 status_code=404, content={"error": "Sighting not found"}
             )
         if sighting.cat_id:
-            cat = session.get(Cat, sighting.cat_id)
-            if cat:
-                cat.total_sightings = max(0, cat.total_sightings - 1)
-        sighting.deleted_at = datetime.now(timezone.utc)
+            _add_cat_sightings(session, sighting.cat_id, -1, touch_last_seen=False)
+        sighting.deleted_at = func.now()
         session.commit()
         return {"deleted": sighting_id}
 
@@ -283,6 +305,7 @@ class ClipLockRequest(BaseModel):
 
 class ClipCompleteRequest(BaseModel):
     source_key: str
+    worker_id: str | None = None
     detections: int = 0
     error: str | None = None
 
@@ -301,46 +324,64 @@ def clip_status(source_key: str):
         return {
             "status": clip.status,
             "worker_id": clip.worker_id,
-            "started_at": clip.started_at.isoformat() if clip.started_at else None,
-            "completed_at": clip.completed_at.isoformat()
-            if clip.completed_at
-            else None,
+            "started_at": clip.started_at,
+            "completed_at": clip.completed_at,
             "detections": clip.detections,
         }
 
 
 @app.post("/clips/lock")
 def clip_lock(req: ClipLockRequest):
-    """Attempt to lock a clip for processing. Always returns 200 with lock result."""
+    """Attempt to lock a clip for processing. Always returns 200 with lock result.
+
+    Re-posting a lock the worker already holds renews it; workers do so while
+    a clip is queued or processing, so started_at is the last renewal.
+    """
     with Session() as session:
+        # Insert the lock, renew our own, or take over one that has not been
+        # renewed for CLIP_LOCK_TTL (its worker presumably crashed)
+        stmt = pg_insert(ProcessedClip).values(
+            source_key=req.source_key,
+            status="processing",
+            worker_id=req.worker_id,
+        )
+        clip_id = session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["source_key"],
+                set_={"worker_id": stmt.excluded.worker_id, "started_at": func.now()},
+                where=(ProcessedClip.status == "processing")
+                & (
+                    (ProcessedClip.worker_id == stmt.excluded.worker_id)
+                    | (
+                        ProcessedClip.started_at
+                        < func.now() - timedelta(seconds=CLIP_LOCK_TTL)
+                    )
+                ),
+            ).returning(ProcessedClip.id)
+        ).scalar_one_or_none()
+        session.commit()
+        if clip_id is not None:
+            return {"locked": True, "status": "processing"}
+
         existing = (
             session.query(ProcessedClip)
             .filter(ProcessedClip.source_key == req.source_key)
             .first()
         )
-        if existing:
-            return {
-                "locked": False,
-                "status": existing.status,
-                "worker_id": existing.worker_id,
-            }
-        try:
-            clip = ProcessedClip(
-                source_key=req.source_key,
-                status="processing",
-                worker_id=req.worker_id,
-            )
-            session.add(clip)
-            session.commit()
-            return {"locked": True, "status": "processing"}
-        except IntegrityError:
-            session.rollback()
-            return {"locked": False, "status": "processing"}
+        return {
+            "locked": False,
+            "status": existing.status if existing else "processing",
+            "worker_id": existing.worker_id if existing else None,
+        }
 
 
 @app.post("/clips/complete")
 def clip_complete(req: ClipCompleteRequest):
-    """Mark a clip as done or errored."""
+    """Mark a clip as done or errored.
+
+    If worker_id is given, it must still hold the clip's lock; a worker whose
+    lock was taken over gets a 409 and leaves the clip to the new owner.
+    """
     with Session() as session:
         clip = (
             session.query(ProcessedClip)
@@ -349,8 +390,15 @@ def clip_complete(req: ClipCompleteRequest):
         )
         if not clip:
             return JSONResponse(status_code=404, content={"error": "Clip not found"})
+        if req.worker_id and (
+            clip.status != "processing" or clip.worker_id != req.worker_id
+        ):
+            return JSONResponse(
+                status_code=409,
+                content={"error": "Clip is no longer locked by this worker"},
+            )
         clip.status = "error" if req.error else "done"
-        clip.completed_at = datetime.now(timezone.utc)
+        clip.completed_at = func.now()
         clip.detections = req.detections
         session.commit()
         return {"status": clip.status}
@@ -369,7 +417,6 @@ def restore_cat(cat_id: int):
             )
         cat.deleted_at = None
         session.commit()
-        session.refresh(cat)
         return _cat_to_dict(cat)
 
 
@@ -383,11 +430,8 @@ def restore_sighting(sighting_id: int):
             )
         sighting.deleted_at = None
         if sighting.cat_id:
-            cat = session.get(Cat, sighting.cat_id)
-            if cat:
-                cat.total_sightings += 1
+            _add_cat_sightings(session, sighting.cat_id, 1, touch_last_seen=False)
         session.commit()
-        session.refresh(sighting)
         return _sighting_to_dict(sighting)
 
 
@@ -396,18 +440,21 @@ def purge_deleted():
     with Session() as session:
         # Purge deleted sightings
         deleted_sightings = (
-            session.query(Sighting).filter(Sighting.deleted_at.isnot(None)).count()
+            session.query(Sighting)
+            .filter(Sighting.deleted_at.isnot(None))
+            .delete(synchronize_session=False)
+        )
+
+        # Purge deleted cats, unlinking their remaining sightings first
+        deleted_cat_ids = select(Cat.id).where(Cat.deleted_at.isnot(None))
+        session.query(Sighting).filter(Sighting.cat_id.in_(deleted_cat_ids)).update(
+            {"cat_id": None}, synchronize_session=False
+        )
+        cats_count = (
+            session.query(Cat)
+            .filter(Cat.deleted_at.isnot(None))
+            .delete(synchronize_session=False)
         )
-        session.query(Sighting).filter(Sighting.deleted_at.isnot(None)).delete()
-
-        # Purge deleted cats
-        deleted_cats = session.query(Cat).filter(Cat.deleted_at.isnot(None)).all()
-        cats_count = len(deleted_cats)
-        for cat in deleted_cats:
-            session.query(Sighting).filter(Sighting.cat_id == cat.id).update(
-                {"cat_id": None}
-            )
-            session.delete(cat)
         session.commit()
         return {"purged_cats": cats_count, "purged_sightings": deleted_sightings}
 
@@ -418,14 +465,19 @@ def purge_deleted():
 @app.get("/stats")
 def stats():
     with Session() as session:
+        total_cats, total_sightings, unassigned_sightings = session.execute(
+            select(
+                select(func.count(Cat.id))
+                .where(Cat.deleted_at.is_(None))
+                .scalar_subquery(),
+                func.count(Sighting.id),
+                func.count(Sighting.id).filter(Sighting.cat_id.is_(None)),
+            ).where(Sighting.deleted_at.is_(None))
+        ).one()
         return {
-            "total_cats": session.query(Cat).filter(Cat.deleted_at.is_(None)).count(),
-            "total_sightings": session.query(Sighting)
-            .filter(Sighting.deleted_at.is_(None))
-            .count(),
-            "unassigned_sightings": session.query(Sighting)
-            .filter(Sighting.cat_id.is_(None), Sighting.deleted_at.is_(None))
-            .count(),
+            "total_cats": total_cats,
+            "total_sightings": total_sightings,
+            "unassigned_sightings": unassigned_sightings,
         }
 
 
@@ -438,24 +490,56 @@ def get_crop(key: str):
     s3 = get_s3_client()
     try:
         resp = s3.get_object(Bucket=get_bucket(), Key=key)
-        data = resp["Body"].read()
-        content_type = resp.get("ContentType", "image/jpeg")
-        return Response(content=data, media_type=content_type)
     except Exception:
         return Response(status_code=404, content=b"Not found")
+    return _stream_object(resp, "image/jpeg", accept_ranges=False)
 
 
 @app.get("/videos/{key:path}")
-def get_video(key: str):
-    """Proxy a video file from S3."""
+def get_video(key: str, range_header: str | None = Header(None, alias="Range")):
+    """Proxy a video file from S3, honouring Range requests for seeking."""
     s3 = get_s3_client()
+    kwargs = {"Bucket": get_bucket(), "Key": key}
+    if range_header:
+        kwargs["Range"] = range_header
     try:
-        resp = s3.get_object(Bucket=get_bucket(), Key=key)
-        data = resp["Body"].read()
-        content_type = resp.get("ContentType", "video/mp4")
-        return Response(content=data, media_type=content_type)
-    except Exception:
-        return Response(status_code=404, content=b"Not found")
+        resp = s3.get_object(**kwargs)
+    except s3.exceptions.ClientError as e:
+        error = e.response["Error"]
+        if (
+            error["Code"] == "InvalidRange"
+            or e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 416
+        ):
+            size = error.get("ActualObjectSize")
+            if size is None:
+                size = s3.head_object(Bucket=get_bucket(), Key=key)["ContentLength"]
+            return Response(
+                status_code=416, headers={"Content-Range": f"bytes */{size}"}
+            )
+        if error["Code"] in ("NoSuchKey", "404"):
+            return Response(status_code=404, content=b"Not found")
+        raise
+    return _stream_object(resp, "video/mp4", accept_ranges=True)
+
+
+def _stream_object(resp, default_content_type, accept_ranges):
+    """Stream an S3 get_object response to the client in chunks.
+
+    Only advertise Accept-Ranges for endpoints that forward the Range header.
+    """
+    headers = {"Content-Length": str(resp["ContentLength"])}
+    if accept_ranges:
+        headers["Accept-Ranges"] = "bytes"
+    status_code = 200
+    if resp.get("ContentRange"):
+        headers["Content-Range"] = resp["ContentRange"]
+        status_code = 206
+    return StreamingResponse(
+        resp["Body"].iter_chunks(chunk_size=64 * 1024),
+        status_code=status_code,
+        media_type=resp.get("ContentType", default_content_type),
+        headers=headers,
+    )
 
 
 # --- Query helpers ---
@@ -468,16 +552,63 @@ def _get_active_cat(session, cat_id):
     return cat
 
 
+def _add_cat_sightings(session, cat_id, count, touch_last_seen=True):
+    """Atomically adjust a cat's sighting counter (never below 0) in SQL."""
+    values = {"total_sightings": func.greatest(Cat.total_sightings + count, 0)}
+    if touch_last_seen:
+        values["last_seen"] = func.now()
+    session.execute(
+        update(Cat)
+        .where(Cat.id == cat_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _fetch_dicts(session, stmt):
+    """Run a column SELECT and return plain dicts, bypassing the ORM."""
+    return [dict(row) for row in session.execute(stmt).mappings()]
+
+
 # --- Serialization helpers ---
 
+# Columns of _cat_to_dict / _sighting_to_dict, for Core list queries
+CAT_COLUMNS = (
+    Cat.id,
+    Cat.name,
+    Cat.notes,
+    Cat.first_seen,
+    Cat.last_seen,
+    Cat.total_sightings,
+)
+SIGHTING_COLUMNS = (
+    Sighting.id,
+    Sighting.cat_id,
+    Sighting.timestamp,
+    Sighting.confidence,
+    Sighting.source_key,
+    Sighting.crop_key,
+    Sighting.frame_timestamp,
+)
+
+
+def _sighting_values(req):
+    return {
+        "cat_id": req.cat_id,
+        "confidence": req.confidence,
+        "source_key": req.source_key,
+        "crop_key": req.crop_key,
+        "frame_timestamp": req.frame_timestamp,
+    }
+
 
 def _cat_to_dict(cat):
     return {
         "id": cat.id,
         "name": cat.name,
         "notes": cat.notes,
-        "first_seen": cat.first_seen.isoformat() if cat.first_seen else None,
-        "last_seen": cat.last_seen.isoformat() if cat.last_seen else None,
+        "first_seen": cat.first_seen,
+        "last_seen": cat.last_seen,
         "total_sightings": cat.total_sightings,
     }
 
@@ -486,7 +617,7 @@ def _sighting_to_dict(sighting):
     return {
         "id": sighting.id,
         "cat_id": sighting.cat_id,
-        "timestamp": sighting.timestamp.isoformat() if sighting.timestamp else None,
+        "timestamp": sighting.timestamp,
         "confidence": sighting.confidence,
         "source_key": sighting.source_key,
         "crop_key": sighting.crop_key,
@@ -1,10 +1,12 @@
 from .model import (
+    ALL_EXTENSIONS,
     ANIMAL_CLASSES,
     ANNOTATION_COLORS,
     IMAGE_EXTENSIONS,
     VIDEO_EXTENSIONS,
     annotate_frame,
     detect_frame,
+    detect_frames,
     get_device,
     load_model,
     process_image,
@@ -1,5 +1,10 @@
 """Core animal detection logic using YOLOv8."""
 
+import os
+import queue
+import shutil
+import tempfile
+import threading
 from pathlib import Path
 
 import cv2
@@ -12,8 +17,9 @@ ANIMAL_CLASSES = {
     21: "bear",
 }
 
-IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tiff"}
-VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".wmv", ".flv", ".m4v"}
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tiff"})
+VIDEO_EXTENSIONS = frozenset({".mp4", ".avi", ".mov", ".mkv", ".wmv", ".flv", ".m4v"})
+ALL_EXTENSIONS = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
 
 ANNOTATION_COLORS = {
     "cat": (0, 255, 0),
@@ -33,45 +39,148 @@ def get_device():
     return "cpu"
 
 
-def load_model(model_path="yolov8m.pt", device=None):
-    """Load YOLOv8 model on the best available device."""
+def load_model(
+    model_path="yolov8m.pt",
+    device=None,
+    batch=8,
+    precision="fp16",
+    imgsz=640,
+    calibration_data=None,
+    engine_dir=None,
+):
+    """Load YOLOv8 model on the best available device.
+
+    On CUDA the model is exported once to a TensorRT engine (fp16 or int8)
+    in engine_dir (next to the weights by default) and the engine is loaded
+    instead. Engines are cached per GPU, TensorRT version, batch size, image
+    size and precision. Falls back to PyTorch if the export fails (e.g.
+    TensorRT not installed).
+    """
     if device is None:
         device = get_device()
+
+    if device == "cuda":
+        try:
+            model = _load_engine(
+                model_path, batch, imgsz, precision, calibration_data, engine_dir
+            )
+            return model, device
+        except Exception as e:
+            print(f"  Warning: TensorRT unavailable, using PyTorch: {e}")
+
     model = YOLO(model_path)
     model.to(device)
     return model, device
 
 
+def _load_engine(model_path, batch, imgsz, precision, calibration_data, engine_dir):
+    """Load the cached TensorRT engine, exporting it first if needed.
+
+    A cached engine that fails to load (e.g. a corrupt file) is deleted and
+    rebuilt rather than left to fail on every start.
+    """
+    engine_path = _engine_path(model_path, batch, imgsz, precision, engine_dir)
+    if engine_path.exists():
+        try:
+            return _warm_up(YOLO(str(engine_path), task="detect"), imgsz)
+        except Exception as e:
+            print(f"  Cached engine {engine_path} failed to load, rebuilding: {e}")
+            engine_path.unlink(missing_ok=True)
+
+    print(f"Exporting TensorRT engine to {engine_path} (one-time)")
+    export_args = {"half": True}
+    if precision == "int8":
+        export_args = {"int8": True}
+        if calibration_data:
+            export_args["data"] = calibration_data
+    exported = YOLO(model_path).export(
+        format="engine",
+        imgsz=imgsz,
+        dynamic=True,
+        batch=batch,
+        workspace=4,
+        device=0,
+        **export_args,
+    )
+    engine_path.parent.mkdir(parents=True, exist_ok=True)
+    # The engine dir is usually a shared volume on another device: copy to a
+    # temp name beside the target, then swap it in atomically so other
+    # workers never see a half-written engine
+    fd, tmp = tempfile.mkstemp(dir=engine_path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(exported, tmp)
+        os.replace(tmp, engine_path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    Path(exported).unlink(missing_ok=True)
+    return _warm_up(YOLO(str(engine_path), task="detect"), imgsz)
+
+
+def _warm_up(model, imgsz):
+    """Run one blank frame so the engine is deserialized now, not mid-clip."""
+    model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)
+    return model
+
+
+def _engine_path(model_path, batch, imgsz, precision, engine_dir=None):
+    """Cache path for a TensorRT engine built with these settings on this GPU."""
+    import tensorrt
+    import torch
+
+    # Engines only run on the GPU model and TensorRT version they were built for
+    gpu = "".join(
+        c if c.isalnum() else "-" for c in torch.cuda.get_device_name(0).lower()
+    )
+    path = Path(model_path)
+    name = (
+        f"{path.stem}_{gpu}_trt{tensorrt.__version__}"
+        f"_b{batch}_{imgsz}_{precision}.engine"
+    )
+    return Path(engine_dir) / name if engine_dir else path.with_name(name)
+
+
 def detect_frame(frame, model, confidence=0.25):
     """Run animal detection on a single frame (numpy array, BGR).
 
     Returns list of dicts with keys: bbox, confidence, crop, animal
     """
-    results = model(frame, verbose=False, conf=confidence)[0]
-    detections = []
+    return detect_frames([frame], model, confidence)[0]
 
-    for box in results.boxes:
-        class_id = int(box.cls[0])
-        conf = float(box.conf[0])
 
-        if class_id not in ANIMAL_CLASSES:
-            continue
+def detect_frames(frames, model, confidence=0.25):
+    """Run animal detection on a batch of frames in a single model call.
 
-        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+    Returns one detection list (see detect_frame) per input frame, in order.
+    """
+    # Class filtering happens inside NMS, so other COCO classes never
+    # compete for the per-image detection budget
+    results = model(
+        frames, verbose=False, conf=confidence, classes=list(ANIMAL_CLASSES)
+    )
+    return [_decode_results(r, f) for r, f in zip(results, frames)]
 
-        # Expand bounding box by 50% in each direction to double crop size
-        bw, bh = x2 - x1, y2 - y1
-        x1 = x1 - bw * 0.5
-        y1 = y1 - bh * 0.5
-        x2 = x2 + bw * 0.5
-        y2 = y2 + bh * 0.5
 
-        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+def _decode_results(results, frame):
+    """Turn one YOLO result into detection dicts with crops from frame."""
+    # One device-to-host copy for the whole result: rows of x1, y1, x2, y2,
+    # conf, class
+    boxes = results.boxes.cpu().numpy().data
 
-        h, w = frame.shape[:2]
-        x1, y1 = max(0, x1), max(0, y1)
-        x2, y2 = min(w, x2), min(h, y2)
+    # Expand bounding box by 50% in each direction to double crop size
+    xyxy = boxes[:, :4]
+    half_wh = (xyxy[:, 2:] - xyxy[:, :2]) * 0.5
+    xyxy = np.hstack([xyxy[:, :2] - half_wh, xyxy[:, 2:] + half_wh]).astype(int)
 
+    h, w = frame.shape[:2]
+    xyxy[:, 0::2] = xyxy[:, 0::2].clip(0, w)
+    xyxy[:, 1::2] = xyxy[:, 1::2].clip(0, h)
+
+    detections = []
+    for (x1, y1, x2, y2), conf, class_id in zip(
+        xyxy.tolist(), boxes[:, 4].tolist(), boxes[:, 5].astype(int).tolist()
+    ):
         crop = frame[y1:y2, x1:x2]
         detections.append(
             {
@@ -85,14 +194,33 @@ def detect_frame(frame, model, confidence=0.25):
     return detections
 
 
-def annotate_frame(frame, detections):
-    """Draw bounding boxes and labels on a frame. Returns a copy."""
-    annotated = frame.copy()
+def annotate_frame(frame, detections, out=None):
+    """Draw bounding boxes and labels on a copy of a frame and return it.
+
+    The copy is `out` when given: a preallocated array of the frame's shape,
+    reused across frames instead of allocating a new one each call.
+    """
+    if out is None:
+        annotated = frame.copy()
+    else:
+        np.copyto(out, frame)
+        annotated = out
+
+    # One polylines call per colour instead of one rectangle call per box
+    boxes_by_color = {}
     for det in detections:
         x1, y1, x2, y2 = det["bbox"]
         color = ANNOTATION_COLORS.get(det["animal"], (255, 255, 255))
+        boxes_by_color.setdefault(color, []).append(
+            [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+        )
+    for color, boxes in boxes_by_color.items():
+        cv2.polylines(annotated, np.asarray(boxes, dtype=np.int32), True, color, 2)
+
+    for det in detections:
+        x1, y1 = det["bbox"][:2]
+        color = ANNOTATION_COLORS.get(det["animal"], (255, 255, 255))
         label = f"{det['animal'].title()}: {det['confidence']:.0%}"
-        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
         cv2.putText(
             annotated,
             label,
@@ -116,14 +244,16 @@ def process_image(path, model, confidence=0.25):
     return image, detect_frame(image, model, confidence)
 
 
-def process_video(path, model, confidence=0.25, frame_skip=None, every=1.0):
+def process_video(path, model, confidence=0.25, frame_skip=None, every=1.0, batch=8):
     """Detect animals in a video file.
 
+    Sampled frames are run through the model `batch` at a time.
     Yields (frame_num, timestamp, frame, detections) for each processed frame.
     """
-    cap = cv2.VideoCapture(str(path))
+    cap = _open_capture(path)
     if not cap.isOpened():
         return
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
     fps = cap.get(cv2.CAP_PROP_FPS) or 30
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
@@ -142,28 +272,107 @@ def process_video(path, model, confidence=0.25, frame_skip=None, every=1.0):
         "skip": skip,
     }
 
-    frame_num = 0
+    # Decode on a background thread so the next batch is ready while the
+    # current one is in the model. OpenCV releases the GIL while decoding.
+    frames = queue.Queue(maxsize=2 * batch)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_frames, args=(cap, skip, frames, stop), daemon=True
+    )
+    reader.start()
+
+    pending_frames = []
+    pending_nums = []
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            item = frames.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            frame_num, frame = item
+            pending_frames.append(frame)
+            pending_nums.append(frame_num)
+            if len(pending_frames) >= batch:
+                yield from _flush_batch(
+                    pending_frames, pending_nums, fps, model, confidence
+                )
+                pending_frames, pending_nums = [], []
+
+        if pending_frames:
+            yield from _flush_batch(
+                pending_frames, pending_nums, fps, model, confidence
+            )
+    finally:
+        stop.set()
+        reader.join()
+        cap.release()
+
+
+def _open_capture(path):
+    """Open a video, decoding on the GPU/media engine when OpenCV can."""
+    cap = cv2.VideoCapture(
+        str(path),
+        cv2.CAP_FFMPEG,
+        [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY],
+    )
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(str(path))
+    return cap
+
+
+def _read_frames(cap, skip, out, stop):
+    """Decode every `skip`th frame into `out` as (frame_num, frame).
+
+    Puts None when the video ends, or the exception if decoding fails.
+    Exits early once `stop` is set.
+    """
+    frame_num = 0
+    end = None
+    try:
+        while not stop.is_set():
+            # grab() only decodes; the download from a hardware decoder and
+            # the colour conversion to BGR happen in retrieve(), so skipped
+            # frames never pay for them
+            if not cap.grab():
                 break
 
             if frame_num % skip != 0:
                 frame_num += 1
                 continue
 
-            timestamp = frame_num / fps
-            detections = detect_frame(frame, model, confidence)
-
-            yield {
-                "type": "frame",
-                "frame_num": frame_num,
-                "timestamp": timestamp,
-                "frame": frame,
-                "detections": detections,
-            }
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
 
+            _put_until_stopped(out, (frame_num, frame), stop)
             frame_num += 1
+    except Exception as e:
+        end = e
     finally:
-        cap.release()
+        _put_until_stopped(out, end, stop)
+
+
+def _put_until_stopped(q, item, stop):
+    """Block on a bounded queue without outliving a consumer that went away."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _flush_batch(frames, frame_nums, fps, model, confidence):
+    """Run one batched inference and yield a frame result per input, in order."""
+    for frame, frame_num, detections in zip(
+        frames, frame_nums, detect_frames(frames, model, confidence)
+    ):
+        yield {
+            "type": "frame",
+            "frame_num": frame_num,
+            "timestamp": frame_num / fps,
+            "frame": frame,
+            "detections": detections,
+        }
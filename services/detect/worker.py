@@ -2,13 +2,22 @@
 
 import os
 import platform
+import queue
+import sqlite3
 import threading
 import time
 import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import cv2
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ..storage import (
     download_to_temp,
@@ -17,8 +26,8 @@ from ..storage import (
     upload_bytes,
 )
 from .model import (
+    ALL_EXTENSIONS,
     IMAGE_EXTENSIONS,
-    VIDEO_EXTENSIONS,
     load_model,
     process_image,
     process_video,
@@ -30,11 +39,61 @@ CROPS_PREFIX = os.environ.get("S3_CROPS_PREFIX", "crops/")
 POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "5"))
 CONFIDENCE = float(os.environ.get("CONFIDENCE", "0.25"))
 FRAME_SKIP = int(os.environ.get("FRAME_SKIP", "4"))
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "8"))
+CROP_UPLOAD_WORKERS = 8
+MAX_PENDING_CROPS = 32
+PREFETCH_CLIPS = int(os.environ.get("PREFETCH_CLIPS", "2"))
+SEEN_KEYS_DB = os.environ.get("SEEN_KEYS_DB")
+WORKER_SHARDS = int(os.environ.get("WORKER_SHARDS", "1"))
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", "0"))
+TRT_PRECISION = os.environ.get("TRT_PRECISION", "fp16")
+TRT_CALIBRATION_DATA = os.environ.get("TRT_CALIBRATION_DATA")
+ENGINE_DIR = os.environ.get("ENGINE_DIR")
 CATALOG_URL = os.environ.get("CATALOG_URL", "http://catalog:8001")
+# Must stay well under the catalog's CLIP_LOCK_TTL (default 1h)
+LOCK_RENEW_INTERVAL = int(os.environ.get("LOCK_RENEW_INTERVAL", "300"))
+
+# Checked at import so a misconfigured worker fails at startup instead of
+# silently matching no keys or dying in its background thread
+if WORKER_SHARDS < 1 or not 0 <= SHARD_INDEX < WORKER_SHARDS:
+    raise ValueError(
+        "Need WORKER_SHARDS >= 1 and 0 <= SHARD_INDEX < WORKER_SHARDS, "
+        f"got WORKER_SHARDS={WORKER_SHARDS}, SHARD_INDEX={SHARD_INDEX}"
+    )
+if PREFETCH_CLIPS < 0:
+    raise ValueError(f"Need PREFETCH_CLIPS >= 0, got {PREFETCH_CLIPS}")
+
+# Matches cv2.imencode's default so crops look the same on either encoder
+JPEG_QUALITY = 95
+
+# libjpeg-turbo's SIMD encoder, reused across crops; falls back to cv2
+try:
+    from turbojpeg import TJPF_BGR, TJSAMP_420, TurboJPEG
+
+    _turbojpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbojpeg = None
 
 # Unique worker ID
 WORKER_ID = f"{platform.node()}-{uuid.uuid4().hex[:8]}"
 
+# Keep-alive HTTP session for catalog calls; retries only reconnect, since
+# POSTs that reached the server aren't safe to repeat
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=8, pool_maxsize=32, max_retries=Retry(3, backoff_factor=0.5)
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+# Crop encode + upload pool, created in start_worker
+_upload_pool = None
+_pending_crops = threading.BoundedSemaphore(MAX_PENDING_CROPS)
+
+# Clips locked by this worker and not yet completed, queued or processing;
+# _renew_loop keeps their locks from expiring
+_held_clips = set()
+
 # Worker state
 status = {
     "state": "starting",
@@ -45,29 +104,37 @@ status = {
 }
 
 
+def _post_json(path, payload):
+    """POST a JSON body to the catalog, encoded with orjson."""
+    return SESSION.post(
+        f"{CATALOG_URL}{path}",
+        data=orjson.dumps(payload),
+        headers={"Content-Type": "application/json"},
+        timeout=10,
+    )
+
+
 def try_lock(key):
-    """Try to lock a clip for processing via the catalog API.
-    Returns True if lock acquired, False if already processed/in-progress."""
+    """Try to lock (or renew our lock on) a clip via the catalog API.
+    Returns (locked, status). status is the clip's status in the catalog
+    (processing, done, error), or None if the request itself failed."""
     try:
-        resp = requests.post(
-            f"{CATALOG_URL}/clips/lock",
-            json={"source_key": key, "worker_id": WORKER_ID},
-            timeout=10,
-        )
+        resp = _post_json("/clips/lock", {"source_key": key, "worker_id": WORKER_ID})
         resp.raise_for_status()
-        return resp.json().get("locked", False)
+        result = orjson.loads(resp.content)
+        return result.get("locked", False), result.get("status")
     except Exception as e:
         print(f"  Warning: lock request failed for {key}: {e}")
-    return False
+    return False, None
 
 
 def mark_complete(key, detections, error=None):
     """Mark a clip as done or errored in the catalog."""
     try:
-        payload = {"source_key": key, "detections": detections}
+        payload = {"source_key": key, "worker_id": WORKER_ID, "detections": detections}
         if error:
             payload["error"] = str(error)
-        resp = requests.post(f"{CATALOG_URL}/clips/complete", json=payload, timeout=10)
+        resp = _post_json("/clips/complete", payload)
         resp.raise_for_status()
     except Exception as e:
         print(f"  Warning: failed to mark complete for {key}: {e}")
@@ -76,39 +143,87 @@ def mark_complete(key, detections, error=None):
 def post_sighting(sighting):
     """Post a sighting to the catalog service."""
     try:
-        resp = requests.post(f"{CATALOG_URL}/sightings", json=sighting, timeout=10)
+        resp = _post_json("/sightings", sighting)
         resp.raise_for_status()
-        return resp.json()
+        return orjson.loads(resp.content)
     except Exception as e:
         print(f"  Warning: failed to post sighting: {e}")
         return None
 
 
+def _encode_jpeg(crop):
+    """Encode a BGR crop as JPEG bytes, using libjpeg-turbo when available."""
+    if _turbojpeg is not None:
+        # Crops are strided views into the frame; TurboJPEG needs packed rows.
+        # TurboJPEG defaults to 4:2:2 chroma; cv2 uses 4:2:0
+        return _turbojpeg.encode(
+            np.ascontiguousarray(crop),
+            quality=JPEG_QUALITY,
+            pixel_format=TJPF_BGR,
+            jpeg_subsample=TJSAMP_420,
+        )
+    _, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return encoded.tobytes()
+
+
 def save_crop(crop, source_key, index, timestamp=None):
     """Encode crop as JPEG and upload to S3. Returns the S3 key."""
-    _, encoded = cv2.imencode(".jpg", crop)
+    encoded = _encode_jpeg(crop)
     stem = Path(source_key).stem
     if timestamp is not None:
         crop_key = f"{CROPS_PREFIX}{stem}_{timestamp:.1f}s_{index}.jpg"
     else:
         crop_key = f"{CROPS_PREFIX}{stem}_{index}.jpg"
-    upload_bytes(encoded.tobytes(), crop_key, content_type="image/jpeg")
+    upload_bytes(encoded, crop_key, content_type="image/jpeg")
     return crop_key
 
 
-def process_file(key, model):
-    """Download a file from S3, run detection, post one sighting with best crop."""
-    ext = Path(key).suffix.lower()
-    if ext not in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS:
+def is_supported(key):
+    """Whether a key has an image or video extension the worker can process."""
+    return Path(key).suffix.lower() in ALL_EXTENSIONS
+
+
+def submit_crop(crop, source_key, index, timestamp=None):
+    """Queue save_crop on the upload pool. Returns a Future of the S3 key.
+
+    Blocks while MAX_PENDING_CROPS crops are already in flight, so a flood of
+    detections can't pile up frames in memory.
+    """
+    _pending_crops.acquire()
+    future = _upload_pool.submit(save_crop, crop, source_key, index, timestamp)
+    future.add_done_callback(lambda _: _pending_crops.release())
+    return future
+
+
+def in_shard(key):
+    """Whether this worker's shard owns a key (always true when unsharded)."""
+    return zlib.crc32(key.encode()) % WORKER_SHARDS == SHARD_INDEX
+
+
+def process_file(key, model, download=None):
+    """Download a file from S3, run detection, post one sighting with best crop.
+
+    `download` is an optional future for a download already started by the
+    poll loop; it resolves to the local path.
+    """
+    if not is_supported(key):
         return
+    ext = Path(key).suffix.lower()
 
     status["current_file"] = key
     print(f"Processing: {key}")
 
-    local_path = download_to_temp(key)
+    try:
+        local_path = download.result() if download else download_to_temp(key)
+    except Exception as e:
+        print(f"  Error downloading {key}: {e}")
+        mark_complete(key, 0, error=str(e))
+        return
     all_detections = []
 
     try:
+        # Crops are encoded and uploaded in the background so inference
+        # carries on; they are all resolved before the sighting is posted.
         if ext in IMAGE_EXTENSIONS:
             image, detections = process_image(local_path, model, CONFIDENCE)
             if image is None:
@@ -117,17 +232,18 @@ def process_file(key, model):
                 return
 
             for i, det in enumerate(detections, 1):
-                crop_key = save_crop(det["crop"], key, i)
                 all_detections.append(
                     {
                         "confidence": det["confidence"],
-                        "crop_key": crop_key,
+                        "crop_key": submit_crop(det["crop"], key, i),
                         "frame_timestamp": None,
                     }
                 )
 
         else:
-            for result in process_video(local_path, model, CONFIDENCE, FRAME_SKIP):
+            for result in process_video(
+                local_path, model, CONFIDENCE, FRAME_SKIP, batch=BATCH_SIZE
+            ):
                 if result["type"] == "info":
                     print(
                         f"  Video: {result['total_frames']} frames, {result['fps']:.0f} fps, every {result['skip']} frames"
@@ -135,17 +251,28 @@ def process_file(key, model):
                     continue
 
                 for i, det in enumerate(result["detections"], 1):
-                    crop_key = save_crop(det["crop"], key, i, result["timestamp"])
                     all_detections.append(
                         {
                             "confidence": det["confidence"],
-                            "crop_key": crop_key,
+                            "crop_key": submit_crop(
+                                det["crop"], key, i, result["timestamp"]
+                            ),
                             "frame_timestamp": round(result["timestamp"], 2),
                         }
                     )
 
+        for det in all_detections:
+            det["crop_key"] = det["crop_key"].result()
+
         print(f"  {len(all_detections)} detection(s)")
 
+        # A clip that outlived its lock may have been taken over; only the
+        # current owner posts a sighting and completes it
+        locked, clip_status = try_lock(key)
+        if not locked and clip_status is not None:
+            print(f"  Lost the lock on {key}, leaving it to its new owner")
+            return
+
         if all_detections:
             # Pick the best detection (highest confidence) for the sighting
             best = max(all_detections, key=lambda d: d["confidence"])
@@ -178,25 +305,75 @@ def poll_loop(model):
     endpoint = os.environ.get("S3_ENDPOINT_URL", "s3.amazonaws.com")
     bucket = get_bucket()
     print(f"Watching {endpoint}/{bucket}/{S3_WATCH_PREFIX} every {POLL_INTERVAL}s")
-    print(f"  confidence={CONFIDENCE}, frame_skip={FRAME_SKIP}")
+    print(f"  confidence={CONFIDENCE}, frame_skip={FRAME_SKIP}, batch={BATCH_SIZE}")
     print(f"  catalog={CATALOG_URL}")
+    if WORKER_SHARDS > 1:
+        print(f"  shard {SHARD_INDEX} of {WORKER_SHARDS}")
+
+    # Listing runs on its own thread so a slow paginated listing never
+    # stalls detection; it hands over each new key exactly once.
+    seen_db, known_keys = _open_seen_keys()
+    new_keys = queue.Queue()
+    threading.Thread(
+        target=_list_loop, args=(new_keys, known_keys), daemon=True
+    ).start()
+    threading.Thread(target=_renew_loop, daemon=True).start()
+
+    # PREFETCH_CLIPS=0 still downloads the current clip, just not ahead
+    download_pool = ThreadPoolExecutor(max_workers=max(1, PREFETCH_CLIPS))
+    # Locked clips whose downloads are running ahead of detection
+    prefetched = deque()
+
+    while True:
+        try:
+            # Lock and start downloading queued keys up to the prefetch depth;
+            # only wait on the lister when there is nothing left to process.
+            while len(prefetched) <= PREFETCH_CLIPS:
+                try:
+                    key = new_keys.get(block=not prefetched)
+                except queue.Empty:
+                    break
+                if not is_supported(key):
+                    continue
+                locked, clip_status = try_lock(key)
+                if not locked:
+                    # Only finished clips are settled; a failed request or a
+                    # clip another worker holds may still need us later
+                    if clip_status in ("done", "error"):
+                        _remember_key(seen_db, key)
+                    continue
+                _held_clips.add(key)
+                download = download_pool.submit(download_to_temp, key)
+                prefetched.append((key, download))
+
+            key, download = prefetched.popleft()
+            status["state"] = "processing"
+            try:
+                process_file(key, model, download)
+            finally:
+                _held_clips.discard(key)
+            _remember_key(seen_db, key)
+            status["state"] = "idle"
+        except Exception as e:
+            print(f"Poll error: {e}")
+            status["state"] = "error"
 
-    known_keys = set()
 
+def _list_loop(new_keys, known_keys):
+    """List the watch prefix every POLL_INTERVAL and queue keys not seen before."""
     while True:
         try:
-            keys = list_objects(S3_WATCH_PREFIX)
-            for key in keys:
+            for key in list_objects(S3_WATCH_PREFIX):
                 if key.endswith("/"):
                     continue
                 if key in known_keys:
                     continue
-                if not try_lock(key):
-                    known_keys.add(key)
-                    continue
-                status["state"] = "processing"
-                process_file(key, model)
                 known_keys.add(key)
+                if not in_shard(key):
+                    continue
+                new_keys.put(key)
+            # Clear an error left by a previous failed listing
+            if status["state"] == "error":
                 status["state"] = "idle"
         except Exception as e:
             print(f"Poll error: {e}")
@@ -205,9 +382,52 @@ def poll_loop(model):
         time.sleep(POLL_INTERVAL)
 
 
+def _renew_loop():
+    """Re-post the lock on every held clip every LOCK_RENEW_INTERVAL seconds.
+
+    The catalog hands a lock to another worker once it goes CLIP_LOCK_TTL
+    without renewal, so long clips and clips waiting in the prefetch queue
+    must keep renewing theirs.
+    """
+    while True:
+        time.sleep(LOCK_RENEW_INTERVAL)
+        # copy() is atomic under the GIL; the poll loop mutates the set
+        for key in _held_clips.copy():
+            try_lock(key)
+
+
+def _open_seen_keys():
+    """Open the SQLite store of keys already processed, if enabled.
+
+    Returns (connection, set of stored keys). With SEEN_KEYS_DB unset the
+    connection is None and every key is retried once after a restart.
+    """
+    if not SEEN_KEYS_DB:
+        return None, set()
+    db = sqlite3.connect(SEEN_KEYS_DB)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE IF NOT EXISTS seen_keys (key TEXT PRIMARY KEY)")
+    return db, {row[0] for row in db.execute("SELECT key FROM seen_keys")}
+
+
+def _remember_key(db, key):
+    """Persist a key that is finished and needs no further lock attempts."""
+    if db is None:
+        return
+    with db:
+        db.execute("INSERT OR IGNORE INTO seen_keys (key) VALUES (?)", (key,))
+
+
 def start_worker():
     """Load model and start the polling loop."""
+    global _upload_pool
     print(f"Starting detection worker (version: {os.environ.get('VERSION', 'dev')})")
-    model, device = load_model()
+    model, device = load_model(
+        batch=BATCH_SIZE,
+        precision=TRT_PRECISION,
+        calibration_data=TRT_CALIBRATION_DATA,
+        engine_dir=ENGINE_DIR,
+    )
     print(f"YOLOv8m loaded on {device}")
+    _upload_pool = ThreadPoolExecutor(max_workers=CROP_UPLOAD_WORKERS)
     poll_loop(model)
@@ -1,15 +1,21 @@
 """Shared S3 storage client for all services."""
 
+import functools
 import os
 import tempfile
 from pathlib import Path
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 
 
+@functools.lru_cache(maxsize=1)
 def get_s3_client():
-    """Create an S3 client from environment variables.
+    """Get the shared S3 client, created from environment variables.
+
+    The client is thread-safe and reused so its keep-alive connection pool
+    is shared across calls.
 
     Env vars:
         S3_ENDPOINT_URL  — custom endpoint (for MinIO, LocalStack, etc.)
@@ -19,28 +25,41 @@ def get_s3_client():
     kwargs = {
         "region_name": os.environ.get("S3_REGION", "us-east-1"),
     }
+    config = Config(
+        max_pool_connections=64,
+        retries={"max_attempts": 5, "mode": "adaptive"},
+        tcp_keepalive=True,
+    )
     endpoint = os.environ.get("S3_ENDPOINT_URL")
     if endpoint:
         kwargs["endpoint_url"] = endpoint
-        kwargs["config"] = Config(s3={"addressing_style": "path"})
+        config = config.merge(Config(s3={"addressing_style": "path"}))
+    kwargs["config"] = config
 
     return boto3.client("s3", **kwargs)
 
 
+@functools.lru_cache(maxsize=1)
 def get_bucket():
     """Get the configured bucket name."""
     return os.environ.get("S3_BUCKET", "catcatalog")
 
 
-def download_to_temp(key):
+def download_to_temp(key, part_size=16 << 20, concurrency=8):
     """Download an S3 object to a temp file. Returns the temp file path.
 
+    Objects larger than part_size are fetched as concurrent ranged GETs.
     Caller is responsible for cleanup.
     """
     s3 = get_s3_client()
     suffix = Path(key).suffix
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    s3.download_fileobj(get_bucket(), key, tmp)
+    config = TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=concurrency,
+    )
+    s3.download_fileobj(get_bucket(), key, tmp, Config=config)
     tmp.close()
     return Path(tmp.name)
 
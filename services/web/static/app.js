@@ -6,6 +6,7 @@ let selectedCatId = null;
 let currentView = "all"; // "all", "unassigned", or a cat id
 let currentPage = 0;
 let lastPageFull = false; // true if last fetch returned PAGE_SIZE results
+let pageCursors = [null]; // keyset cursor (last sighting) before each cat page
 
 async function api(path, opts = {}) {
     const res = await fetch(CATALOG + path, {
@@ -87,6 +88,12 @@ function paginationParams() {
     return `limit=${PAGE_SIZE}&offset=${currentPage * PAGE_SIZE}`;
 }
 
+function catPaginationParams() {
+    const cursor = pageCursors[currentPage];
+    if (!cursor) return `limit=${PAGE_SIZE}`;
+    return `limit=${PAGE_SIZE}&before=${encodeURIComponent(cursor.timestamp)}&before_id=${cursor.id}`;
+}
+
 async function loadAllSightings(resetPage = true) {
     closeSidebar();
     selectedCatId = null;
@@ -126,15 +133,25 @@ async function loadUnassignedSightings(resetPage = true) {
 
 async function loadCatSightings(catId, resetPage = true) {
     const cat = cats.find((c) => c.id === catId);
-    if (resetPage) currentPage = 0;
+    if (resetPage) {
+        currentPage = 0;
+        pageCursors = [null];
+    }
     document.getElementById("sightingsTitle").textContent = cat
         ? `${cat.name || "Unnamed"}'s Sightings`
         : "Sightings";
     try {
         const sightings = await api(
-            `/cats/${catId}/sightings?${paginationParams()}`,
+            `/cats/${catId}/sightings?${catPaginationParams()}`,
         );
         lastPageFull = sightings.length === PAGE_SIZE;
+        if (lastPageFull) {
+            const last = sightings[sightings.length - 1];
+            pageCursors[currentPage + 1] = {
+                timestamp: last.timestamp,
+                id: last.id,
+            };
+        }
         renderSightings(sightings);
     } catch (e) {
         console.error("Cat sightings error:", e);